@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 import os
-import boto3
 import botocore.exceptions
-import datetime
-import re
 import logging
-import time
 import json
 import base64
+import functools
+import random
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 """
 Objective:
@@ -58,685 +59,704 @@ Tag value encoded with base64:
 1. aws tags do not accept JSON format
 2. simplify the process on encode / decode by passing original JSON payload
 
-Limitation:
-- since a page of api response can only contain not more than 100 result, 
-    over 100 result will be omitted in this function
+Pagination:
+- a page of the tagging api response contains not more than 100 result,
+    so the remaining pages are read with the api paginator
 
 """
 
-def lambda_handler(event, context):
-    """
-    :param event: { "details": { "automation": "start", "resource": "rds", "tag key": "AutoStartStop", "tag value": "ExtendedOfficeHour2" } }
-    """
-    print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | Event: {event}')
+# the lambda runtime attaches a handler to the root logger, which prefixes each record with a timestamp
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+# upper bound of concurrent requests sent for RDS actions
+MAX_WORKERS = 16
+
+# upper bound on the instance ids of a single ec2 start_instances / stop_instances call
+EC2_BATCH_SIZE = 1000
+
+# the EKS control plane api has a low rate limit, so node groups are handled by fewer workers,
+# and each EKS request is delayed by a random jitter (in seconds) once more than EKS_JITTER_THRESHOLD node groups are handled
+EKS_MAX_WORKERS = 4
+EKS_JITTER_THRESHOLD = 5
+EKS_MAX_JITTER = 0.1
+
+# error codes returned by AWS when a request is throttled
+THROTTLING_ERROR_CODES = frozenset({'Throttling', 'ThrottlingException', 'TooManyRequestsException', 'RequestLimitExceeded'})
+
+# tag key / tag values accepted in the event payload, see "Time slots based on Tag Values" above
+VALID_TAG_KEYS = frozenset({'DCP/AutoStartStop'})
+VALID_TAG_VALUES = frozenset({'OfficeHour', 'ExtendedOfficeHour1', 'ExtendedOfficeHour2', 'UpperHalf', 'LowerHalf', 'RecurringStop'})
+
+# engine prefix of SQL Server RDS, multi-az deployed SQL Server cannot be stopped
+SQLSERVER_ENGINE_PREFIX = 'sqlserver'
+
+region = os.environ.get('AWS_REGION')    #can only be used on lambda
+# region = 'ap-southeast-1'
+
+# adaptive retry mode applies client side rate limiting and jittered backoff on throttling errors,
+# the connection pool is sized above MAX_WORKERS so that the concurrent requests don't wait for a connection,
+# and short timeouts let a stalled connection be retried instead of holding the lambda until it times out
+CLIENT_CONFIG = {
+    'retries': {
+        'mode': 'adaptive',
+        'max_attempts': 10
+    },
+    'tcp_keepalive': True,
+    'max_pool_connections': MAX_WORKERS * 2,
+    'connect_timeout': 3,
+    'read_timeout': 10
+}
+
+# boto3 is only imported when the first client is needed, so that an invalid payload is rejected without paying for the import
+# session and clients are cached at module scope, so that warm invocations of the same lambda container reuse them
+@functools.lru_cache(maxsize=None)
+def get_session():
+    import boto3
 
     # Use profile with AWS CLI while run locally:
-    # session = boto3.session.Session(profile_name='CORESHAREDTEST-OrgAdmin-6428')
+    # return boto3.session.Session(profile_name='CORESHAREDTEST-OrgAdmin-6428')
 
     # Use lambda role while run remotely:
     # state the source credential / source session
-    session = boto3.session.Session()
+    return boto3.session.Session()
 
-    region = os.environ['AWS_REGION']    #can only be used on lambda
-    # region = 'ap-southeast-1'
+@functools.lru_cache(maxsize=None)
+def get_client(service, region):
+    import botocore.config
 
-    def get_tagged_instance():
+    return get_session().client(service, region_name=region, config=botocore.config.Config(**CLIENT_CONFIG))
 
-        # ResourceTaggingAPI is casted as tagapi
-        tagapi = session.client('resourcegroupstaggingapi', region_name=region)
+def get_tagged_resources(resource_type, tag_key, tag_value):
 
-        print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | session created in {region} for searching tagged ec2')
+    # ResourceTaggingAPI is casted as tagapi
+    tagapi = get_client('resourcegroupstaggingapi', region)
 
-        try:
+    logger.info('session created in %s for searching tagged %s', region, resource_type)
 
-            tagged_resources = tagapi.get_resources(
-                TagFilters = [
-                    {
-                        'Key': event['details']['tag key'],
-                        'Values': [
-                            event['details']['tag value']
-                        ]
-                    }
-                ],
-                ResourcesPerPage = 100,
-                ResourceTypeFilters = [
-                    "ec2:instance"
-                ]
-            )
+    # get_resources returns at most 100 resources per page, so follow the pagination token until all pages are read
+    paginator = tagapi.get_paginator('get_resources')
 
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | request sent')
-            # print(tagged_resources)
-            '''
-            expected out put
-            {'PaginationToken': '', 'ResourceTagMappingList':[{'ResourceARN':'String', 'Tags':{'Key': 'key', 'Value': 'tag value'}}, {others...}]}
-            '''
-        except botocore.exceptions.ClientError as err:
-            logging.error("Couldn't search with the tag key %s. Here's why: %s: %s", event['details']['tag value'],
-                          err.response['Error']['Code'], err.response['Error']['Message'])
-            raise
+    try:
 
-        instanceID_list = []
+        pages = paginator.paginate(
+            # IncludeComplianceDetails = True,    #commented out since not applicable
+            # ExculdeComplianceResource = True,    #commented out since not applicable
+            TagFilters = [
+                {
+                    'Key': tag_key,
+                    'Values': [
+                        tag_value
+                    ]
+                }
+            ],
+            # TagsPerPage = 100,  #commented out since no. of tag per page is not applicable
+            ResourceTypeFilters = [
+                resource_type
+            ],
+            PaginationConfig = {
+                'PageSize': 100
+            }
+        )
 
-        for resources in tagged_resources["ResourceTagMappingList"]:
+        '''
+        expected output of each page
+        {'PaginationToken': '', 'ResourceTagMappingList':[{'ResourceARN':'String', 'Tags':{'Key': 'key', 'Value': 'tag value'}}, {others...}]}
+        '''
 
-            ec2arn = resources["ResourceARN"].split("instance/")
+        tagged_resource_arns = [resources["ResourceARN"] for page in pages for resources in page["ResourceTagMappingList"]]
 
-            instanceID_list.append(ec2arn[1])
+        logger.info('request sent')
 
-        # logging.CRITICAL()
+    except botocore.exceptions.ClientError as err:
+        logger.error("Couldn't search with the tag key %s. Here's why: %s: %s", tag_value,
+                     err.response['Error']['Code'], err.response['Error']['Message'])
+        raise
 
-        return instanceID_list
+    return tagged_resource_arns
 
-    def get_tagged_dbinstance():
+def get_tagged_instance(tag_key, tag_value):
 
-        # ResourceTaggingAPI is casted as tagapi
-        tagapi = session.client('resourcegroupstaggingapi', region_name=region)
+    # arn:aws:ec2:<region>:<AWS ID>:instance/<instance id>
+    return [ec2arn.rpartition("instance/")[2] for ec2arn in get_tagged_resources("ec2:instance", tag_key, tag_value)]
 
-        print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | session created in {region} for searching tagged rds')
+def get_tagged_dbinstance(tag_key, tag_value):
 
-        try:
+    # arn:aws:rds:<region>:<AWS ID>:db:<db instance identifier>
+    return [rdsdbarn.rpartition(":db:")[2] for rdsdbarn in get_tagged_resources("rds:db", tag_key, tag_value)]
 
-            tagged_resources = tagapi.get_resources(
-                # IncludeComplianceDetails = True,    #commented out since not applicable
-                # ExculdeComplianceResource = True,    #commented out since not applicable
-                # PaginationToken='', #commented out since no pagination token is passed here
-                TagFilters = [
-                    {
-                        'Key': event['details']['tag key'],
-                        'Values': [
-                            event['details']['tag value']
-                        ]
-                    }
-                ],
-                # TagsPerPage = 100,  #commented out since no. of tag per page is not applicable
-                ResourcesPerPage = 100,
-                ResourceTypeFilters = [
-                "rds:db"
-                ]
-            )
+def get_tagged_ekscluster(tag_key, tag_value):
 
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | request sent')
-            # print(tagged_resources)
-            '''
-            expected output
-            {'PaginationToken': '', 'ResourceTagMappingList':[{'ResourceARN':'String', 'Tags':{'Key': 'key', 'Value': 'tag value'}}, {others...}]}
-            '''
+    eksnodegroup_list = []
 
-        except botocore.exceptions.ClientError as err:
-            logging.error("Couldn't search with the tag key %s. Here's why: %s: %s", event['details']['tag value'],
-                          err.response['Error']['Code'], err.response['Error']['Message'])
-            raise
+    # arn:aws:eks:<region>:<AWS ID>:nodegroup/<Cluster Name>/<Nodegroup Name>/<Nodegroup ID>
+    for nodegrouparn in get_tagged_resources("eks:nodegroup", tag_key, tag_value):
 
-        dbinstance_list = []
+        cluster, _, nodegroup = nodegrouparn.rpartition(":nodegroup/")[2].partition("/")
+        nodegroupinfo = {"cluster": cluster, "nodegroupname": nodegroup.partition("/")[0]}
 
-        for resources in tagged_resources["ResourceTagMappingList"]:
+        eksnodegroup_list.append(nodegroupinfo)
 
-            rdsdbarn = resources["ResourceARN"].split(":db:")
+    return eksnodegroup_list
 
-            dbinstance_list.append(rdsdbarn[1])
+def get_instances_in_state(ec2, instances, state):
 
-        return dbinstance_list
+    instances_in_state = []
 
-    def get_tagged_ekscluster():
+    # let ec2 filter the instances by state, so that only the candidates are returned
+    paginator = ec2.get_paginator('describe_instances')
 
-        # ResourceTaggingAPI is casted as tagapi
-        tagapi = session.client('resourcegroupstaggingapi', region_name=region)
+    # the instance ids are queried in chunks of 100
+    for i in range(0, len(instances), 100):
 
-        print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | session created in {region} for searching tagged eks node groups')
+        pages = paginator.paginate(
+            InstanceIds=instances[i:i + 100],
+            Filters=[
+                {
+                    'Name': 'instance-state-name',
+                    'Values': [state]
+                }
+            ]
+        )
 
-        try:
+        """
+        expected output of each page
+        {'Reservations': [{'Instances': [{'InstanceId': 'string', 'State': {'Code': 123, 'Name': '<pending | running | stopping | stopped>'}, ...}, ...]}, ...]}
+        """
 
-            tagged_resources = tagapi.get_resources(
-                # IncludeComplianceDetails = True,    #commented out since not applicable
-                # ExculdeComplianceResource = True,    #commented out since not applicable
-                # PaginationToken='', #commented out since no pagination token is passed here
-                TagFilters=[
-                    {
-                        'Key': event['details']['tag key'],
-                        'Values': [
-                            event['details']['tag value']
-                        ]
-                    }
-                ],
-                # TagsPerPage = 100,  #commented out since no. of tag per page is not applicable
-                ResourcesPerPage = 100,
-                ResourceTypeFilters = [
-                    "eks:nodegroup"
-                ]
-            )
+        instances_in_state.extend(instance['InstanceId'] for page in pages for reservation in page['Reservations'] for instance in reservation['Instances'])
 
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | request sent')
-            # print(tagged_resources)
-            '''
-            expected output
-            {'PaginationToken': '', 'ResourceTagMappingList':[{'ResourceARN':'String', 'Tags':{'Key': 'key', 'Value': 'tag value'}}, {others...}]}
-            '''
+    return instances_in_state
 
-        except botocore.exceptions.ClientError as err:
-            logging.error("Couldn't search with the tag key %s. Here's why: %s: %s", event['details']['tag value'],
-                          err.response['Error']['Code'], err.response['Error']['Message'])
-            raise
+def auto_start_instance(instances):
 
-        eksnodegroup_list = []
+    ec2 = get_client('ec2', region)
 
-        for resources in tagged_resources["ResourceTagMappingList"]:
+    logger.info('list of instances: %s', instances)
 
-            nodegrouparn = resources["ResourceARN"].split(":nodegroup/")
-            nodegroup = nodegrouparn[1].split("/")
-            nodegroupinfo = {"cluster": nodegroup[0], "nodegroupname": nodegroup[1]}
+    # no instance ids means describe_instances would return every instance in the region, so skip the lookup
+    if len(instances) == 0:
+        logger.info('No instances should be started')
+        return []
 
+    # only start the instances that are fully stopped, so that running instances won't be started again
+    instances_should_be_started = get_instances_in_state(ec2, instances, 'stopped')
 
-            eksnodegroup_list.append(nodegroupinfo)
+    logger.info('instances to be started: %s', instances_should_be_started)
 
-        return eksnodegroup_list
+    # check instance list, since if length = 0, no further actions should be taken
+    if len(instances_should_be_started) == 0:
+        logger.info('No instances should be started')
+        return []
 
-    def auto_start_instance(instances):
+    responses_started_ec2 = []
 
-        ec2 = session.client('ec2', region_name=region)
+    # start_instances takes at most EC2_BATCH_SIZE instance ids per call
+    for i in range(0, len(instances_should_be_started), EC2_BATCH_SIZE):
+        startec2 = ec2.start_instances(
+            InstanceIds=instances_should_be_started[i:i + EC2_BATCH_SIZE]
+        )
 
-        #core list for instance to be stopped
-        instances_should_be_started = instances.copy()
+        logger.debug('%s', startec2)
         """
-        If using only "instances_should_be_stopped = instances", the function will modify the original list of instances
-        So, need to use "instances_should_be_stopped = instances.copy()" can clone an individual list that no affecting the original list
+        expected output
+        {'StartingInstances': [{'CurrentState': {'Code': <code>,'Name': 'stopping'}, 'InstanceId': 'string', 'PreviousState': {'Code': <code>, 'Name': 'stopping'}}, ...
         """
 
-        print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | list of instances: {instances_should_be_started}')
+        #obtain the list of instances that is started, the instance may have left stopped state after it was described
+        for instance in startec2['StartingInstances']:
 
-        for instance in instances:
+            if instance['PreviousState']['Name'] == 'stopped':
+                responses_started_ec2.append(instance['InstanceId'])
+            else:
+                logger.info('Instance id: %s was %s, it has not been started', instance['InstanceId'], instance['PreviousState']['Name'])
 
-            ec2_states = ec2.describe_instance_status(
-                InstanceIds=[instance]
-            )
+    return responses_started_ec2
 
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | ec2 {instance} states: {ec2_states}')
+def auto_stop_instance(instances):
 
-            """
-            expected output
-            {'InstanceStatuses': [{..., 'InstanceId': 'string','InstanceState': {'Code': 123,'Name': '<running / stopped>'},...}, ...]}
-            
-            *** if the instance had already been stopped, no instance statuses will be returned
-                i.e. {'InstanceStatuses': []}
-            """
+    ec2 = get_client('ec2', region)
 
-            # if the list of instance statuses is not empty (which means not False in python), i.e. instance had been started, so it shouldn't be start again
-            if ec2_states['InstanceStatuses']:
+    logger.info('list of instance: %s', instances)
 
-                instances_should_be_started.remove(instance)
-                print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | Instance id: {instance} has already been started. \n the list now will be: {instances_should_be_started}')
+    # no instance ids means describe_instances would return every instance in the region, so skip the lookup
+    if len(instances) == 0:
+        logger.info('No instances should be stopped')
+        return []
 
-            else:
-                print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | No changes to instance list: {instances_should_be_started}')
+    # only stop the running instances, pending / stopping / stopped instances are filtered out
+    instances_should_be_stopped = get_instances_in_state(ec2, instances, 'running')
 
-        # check instance list, since if length = 0, no further actions should be taken
-        if len(instances_should_be_started) == 0:
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | No instances should be started')
+    logger.info('instances to be stopped: %s', instances_should_be_stopped)
 
-        # if length > 0, startec2 instance in lists
-        elif len(instances_should_be_started) > 0:
-            startec2 = ec2.start_instances(
-                InstanceIds=instances_should_be_started
-            )
+    # check instance list, since if length = 0, no further actions should be taken
+    if len(instances_should_be_stopped) == 0:
+        logger.info('No instances should be stopped')
+        return []
 
-            # print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | {startec2}')
-            """
-            expected output
-            {'StartingInstances': [{'CurrentState': {'Code': <code>,'Name': 'stopping'}, 'InstanceId': 'string', 'PreviousState': {'Code': <code>, 'Name': 'stopping'}}, ...
-            """
+    responses_stopped_ec2 = []
 
-            responses_started_ec2 = []
+    # stop_instances takes at most EC2_BATCH_SIZE instance ids per call
+    for i in range(0, len(instances_should_be_stopped), EC2_BATCH_SIZE):
+        stopec2 = ec2.stop_instances(
+            InstanceIds=instances_should_be_stopped[i:i + EC2_BATCH_SIZE]
+        )
 
-            #obtain the list of instances that is started
-            for ec2 in startec2['StartingInstances']:
+        logger.debug('%s', stopec2)
+        """
+        expected output
+        {'StoppingInstances': [{'CurrentState': {'Code': <code>,'Name': 'stopping'}, 'InstanceId': 'string', 'PreviousState': {'Code': <code>, 'Name': 'stopping'}}, ...
+        """
+
+        #obtain the list of instances that is stopped, the instance may have left running state after it was described
+        for instance in stopec2['StoppingInstances']:
+
+            if instance['PreviousState']['Name'] == 'running':
+                responses_stopped_ec2.append(instance['InstanceId'])
+            else:
+                logger.info('Instance id: %s was %s, it has not been stopped', instance['InstanceId'], instance['PreviousState']['Name'])
+
+    return responses_stopped_ec2
 
-                responses_started_ec2.append(ec2['InstanceId'])
-            return responses_started_ec2
+def get_dbinstance_details(rds, dbinstances):
 
-    def auto_stop_instance(instances):
+    dbinstance_details = {}
 
-        ec2 = session.client('ec2', region_name=region)
+    # describe all tagged db instances with one paginated request instead of one request per db instance
+    paginator = rds.get_paginator('describe_db_instances')
+
+    # the db-instance-id filter is queried in chunks of 100 identifiers
+    for i in range(0, len(dbinstances), 100):
+
+        pages = paginator.paginate(
+            Filters=[
+                {
+                    'Name': 'db-instance-id',
+                    'Values': dbinstances[i:i + 100]
+                }
+            ]
+        )
 
-        #core list for instance to be stopped
-        instances_should_be_stopped = instances.copy()
         """
-        If using only "instances_should_be_stopped = instances", the function will modify the original list of instances
-        So, need to use "instances_should_be_stopped = instances.copy()" can clone an individual list that no affecting the original list
+        expected output of each page
+        {'Marker': 'string', 'DBInstances': [{'DBInstanceIdentifier': 'string',..., 'DBInstanceStatus': '<available | stopped>', 'Engine': <mysql | sqlserver-se>, 'MultiAZ': <True / False>,...}]}
         """
 
-        print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | list of instance: {instances_should_be_stopped}')
+        for page in pages:
+            for dbinstance in page['DBInstances']:
+                dbinstance_details[dbinstance['DBInstanceIdentifier']] = dbinstance
 
-        for instance in instances:
+    return dbinstance_details
 
-            ec2_states = ec2.describe_instance_status(
-                InstanceIds=[instance]
-            )
+def auto_start_dbinstance(dbinstances):
 
-            # print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | ec2 {instance} states: {ec2_states}')
-            """
-            expected output
-            {'InstanceStatuses': [{..., 'InstanceId': 'string','InstanceState': {'Code': 123,'Name': '<running / stopped>'},...}, ...]}
-            
-            *** if the instance had already been stopped, no instance statuses will be returned
-                i.e. {'InstanceStatuses': []}
-            """
+    rds = get_client('rds', region)
 
-            if ec2_states['InstanceStatuses'] == False:
+    logger.info('DB list: %s', dbinstances)
 
-                instances_should_be_stopped.remove(instance)
-                print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | Instance id: {instance} has already been stopped. \n the list now will be: {instances_should_be_stopped}')
+    # no identifiers means the filter would be empty, so skip the lookup
+    if len(dbinstances) == 0:
+        logger.info('No db instances should be started')
+        return []
 
-            else:
-                print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | No changes to instance list: {instances_should_be_stopped}')
+    dbinstance_details = get_dbinstance_details(rds, dbinstances)
 
-        # check instance list, since if length = 0, no further actions should be taken
-        if len(instances_should_be_stopped) == 0:
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | No instances should be stopped')
+    # check each rds instance details
+    for checkrds in dbinstance_details.values():
 
-        # if length > 0, stopec2 instance in lists
-        elif len(instances_should_be_stopped) > 0:
-            stopec2 = ec2.stop_instances(
-                InstanceIds=instances_should_be_stopped
-            )
+        check_rds_details = {}
+        check_rds_details['DB'] = checkrds['DBInstanceIdentifier']
+        check_rds_details['DBMS Engine'] = checkrds['Engine']
+        check_rds_details['MultiAZ Deployment'] = checkrds['MultiAZ']
+        check_rds_details['Status'] = checkrds['DBInstanceStatus']
+        """
+        expected pattern:
+        {'DB': '<string>', 'DBMS Engine': '<mysql | sqlserver-se | sqlserver-web>', 'MultiAZ Deployment': True | False, 'Status': '<available | stopped | ...>'} 
+        """
 
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | {stopec2}')
-            """
-            expected output
-            {'StoppingInstances': [{'CurrentState': {'Code': <code>,'Name': 'stopping'}, 'InstanceId': 'string', 'PreviousState': {'Code': <code>, 'Name': 'stopping'}}, ...
-            """
+        logger.info('RDS named %s: %s', checkrds['DBInstanceIdentifier'], check_rds_details)
 
-            responses_stopped_ec2 = []
+    # identifiers that describe_db_instances did not return are filtered out
+    for rds_dbidentifier in dbinstances:
+        if rds_dbidentifier not in dbinstance_details:
+            logger.info('DB Instance Name: %s is not found', rds_dbidentifier)
 
-            #obtain the list of instances that is stopped
-            for ec2 in stopec2['StoppingInstances']:
+    # Only start up the RDS that fully stopped, if RDS is not found or not in stopped state, will be filtered out
+    dbidentifier_should_be_started = [
+        rds_dbidentifier for rds_dbidentifier in dbinstances
+        if rds_dbidentifier in dbinstance_details
+        and dbinstance_details[rds_dbidentifier]['DBInstanceStatus'] == 'stopped'
+    ]
 
-                responses_stopped_ec2.append(ec2['InstanceId'])
-            return responses_stopped_ec2
+    logger.info('DB instances to be started: %s', dbidentifier_should_be_started)
 
-    def auto_start_dbinstance(dbinstances):
+    response_started_rds = []
 
-        rds = session.client('rds', region_name=region)
+    # check the list, if length = 0, no requests should be sent
+    if len(dbidentifier_should_be_started) == 0:
+        logger.info('No db instances should be started')
 
-        # create a new list for dbinstances
-        dbidentifier_should_be_started = dbinstances.copy()
-        print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | DB list: {dbidentifier_should_be_started} \n')
+    # check the list, if length > 0, send request to stop designated RDS
+    elif len(dbidentifier_should_be_started) > 0:
 
-        # check each rds instance details
-        for rds_dbidentifier in dbinstances:
+        # start_db_instance only takes one db instance per request, so send the requests concurrently
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(dbidentifier_should_be_started))) as executor:
 
-            checkrds = rds.describe_db_instances(
-                DBInstanceIdentifier=rds_dbidentifier
-            )
+            futures = {
+                executor.submit(rds.start_db_instance, DBInstanceIdentifier=rds_dbidentifier): rds_dbidentifier
+                for rds_dbidentifier in dbidentifier_should_be_started
+            }
 
-            # print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | {checkrds})
-            """
-            expected output
-            {'Marker': 'string', 'DBInstances': [{'DBInstanceIdentifier': 'string',..., 'DBInstanceStatus': '<available | stopped>', 'Engine': <mysql | sqlserver-se>, 'MultiAZ': <True / False>,...}]}
-        
-            """
-            # Only start up the RDS that fully stopped, if RDS is not in stopped state, will be filtered out
-            if checkrds['DBInstances'][0]['DBInstanceStatus'] != 'stopped':
-                dbidentifier_should_be_started.remove(rds_dbidentifier)
-                print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | DB Instance Name: {rds_dbidentifier} has already been started. \n the list now will be: {dbidentifier_should_be_started}')
-            else:
-                print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | DB List: \n{dbidentifier_should_be_started}')
+            for future in as_completed(futures):
+                startrds = future.result()
 
-            check_rds_details = {}
-            check_rds_details['DB'] = checkrds['DBInstances'][0]['DBInstanceIdentifier']
-            check_rds_details['DBMS Engine'] = checkrds['DBInstances'][0]['Engine']
-            check_rds_details['MultiAZ Deployment'] = checkrds['DBInstances'][0]['MultiAZ']
-            """
-            expected pattern:
-            {'DB': '<string>', 'DBMS Engine': '<mysql | sqlserver-se | sqlserver-web>', 'MultiAZ Deployment': True | False} 
-            """
+                logger.info('Starting %s', futures[future])
+                logger.debug('%s', startrds)
 
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | RDS named {checkrds["DBInstances"][0]["DBInstanceIdentifier"]}:')
-            print(check_rds_details, "\n")
+                response_started_rds.append(startrds['DBInstance']['DBInstanceIdentifier'])
 
-        response_started_rds = []
+    return response_started_rds
 
-        # check the list, if length = 0, no requests should be sent
-        if len(dbidentifier_should_be_started) == 0:
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | No db instances should be started')
+def auto_stop_dbinstance(dbinstances):
 
-        # check the list, if length > 0, send request to stop designated RDS
-        elif len(dbidentifier_should_be_started) > 0:
+    rds = get_client('rds', region)
 
-            for rds_dbidentifier in dbidentifier_should_be_started:
-                startrds = rds.start_db_instance(
-                    DBInstanceIdentifier=rds_dbidentifier
-                )
+    logger.info('DB list: %s', dbinstances)
 
-                print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | Starting {rds_dbidentifier}:\n{startrds}')
+    # no identifiers means the filter would be empty, so skip the lookup
+    if len(dbinstances) == 0:
+        logger.info('No db instances should be stopped')
+        return []
 
-                response_started_rds.append(startrds['DBInstance']['DBInstanceIdentifier'])
+    dbinstance_details = get_dbinstance_details(rds, dbinstances)
 
-        return response_started_rds
+    for checkrds in dbinstance_details.values():
 
-    def auto_stop_dbinstance(dbinstances):
+        logger.debug('%s', checkrds)
 
-        rds = session.client('rds', region_name=region)
+        check_rds_details = {}
+        check_rds_details['DB'] = checkrds['DBInstanceIdentifier']
+        check_rds_details['DBMS Engine'] = checkrds['Engine']
+        check_rds_details['MultiAZ Deployment'] = checkrds['MultiAZ']
+        check_rds_details['Status'] = checkrds['DBInstanceStatus']
+        """
+        expected pattern:
+        {'DB': '<string>', 'DBMS Engine': '<mysql | sqlserver-se | sqlserver-web>', 'MultiAZ Deployment': True | False, 'Status': '<available | stopped | ...>'} 
+        """
 
-        # create a new list for dbinstances
-        dbidentifier_should_be_stopped = dbinstances.copy()
-        print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | DB list: {dbidentifier_should_be_stopped} \n')
+        logger.info('RDS named %s: %s', checkrds['DBInstanceIdentifier'], check_rds_details)
 
-        for rds_dbidentifier in dbinstances:
+        if checkrds['MultiAZ'] is True and checkrds['Engine'].startswith(SQLSERVER_ENGINE_PREFIX):
+            logger.info('DB Instance Name: %s is an active-active SQL Server, which cannot be stopped', checkrds['DBInstanceIdentifier'])
 
-            checkrds = rds.describe_db_instances(
-                DBInstanceIdentifier=rds_dbidentifier
-            )
+    # identifiers that describe_db_instances did not return are filtered out
+    for rds_dbidentifier in dbinstances:
+        if rds_dbidentifier not in dbinstance_details:
+            logger.info('DB Instance Name: %s is not found', rds_dbidentifier)
 
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | {checkrds}')
-            """
-            expected output
-            {'Marker': 'string', 'DBInstances': [{'DBInstanceIdentifier': 'string',..., 'DBInstanceStatus': '<available | stopped>', 'Engine': <mysql | sqlserver-se>, 'MultiAZ': <True / False>,...}]}
-        
-            """
-            # multi-az deployed SQL server RDS should not be able to stop, so need to filter out those db instances
-            if checkrds['DBInstances'][0]['MultiAZ'] is True and re.search('^sqlserver.*', checkrds['DBInstances'][0]['Engine']) != None:
-                dbidentifier_should_be_stopped.remove(rds_dbidentifier)
-                # using object.group() to show the string matching with the pattern stated in re.search()
-                print(re.search('^sqlserver.*', checkrds['DBInstances'][0]['Engine']).group(), '\n')
-                print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | DB Instance Name: {rds_dbidentifier} is an active-active SQL Server, which cannot be stopped. \n the list now will be: {dbidentifier_should_be_stopped}')
-            #only turn off available RDS, since 'upgrading' or 'starting' RDS should not be distrubed
-            elif checkrds['DBInstances'][0]['DBInstanceStatus'] != 'available':
-                dbidentifier_should_be_stopped.remove(rds_dbidentifier)
-                print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | DB Instance Name: {rds_dbidentifier} has already been stopped. \n the list now will be: {dbidentifier_should_be_stopped}')
-            else:
-                print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | DB List: \n{dbidentifier_should_be_stopped}')
+    # multi-az deployed SQL server RDS should not be able to stop, so need to filter out those db instances
+    # only turn off available RDS, since 'upgrading' or 'starting' RDS should not be distrubed
+    dbidentifier_should_be_stopped = [
+        rds_dbidentifier for rds_dbidentifier in dbinstances
+        if rds_dbidentifier in dbinstance_details
+        and dbinstance_details[rds_dbidentifier]['DBInstanceStatus'] == 'available'
+        and not (dbinstance_details[rds_dbidentifier]['MultiAZ'] is True and dbinstance_details[rds_dbidentifier]['Engine'].startswith(SQLSERVER_ENGINE_PREFIX))
+    ]
 
-            check_rds_details = {}
-            check_rds_details['DB'] = checkrds['DBInstances'][0]['DBInstanceIdentifier']
-            check_rds_details['DBMS Engine'] = checkrds['DBInstances'][0]['Engine']
-            check_rds_details['MultiAZ Deployment'] = checkrds['DBInstances'][0]['MultiAZ']
-            """
-            expected pattern:
-            {'DB': '<string>', 'DBMS Engine': '<mysql | sqlserver-se | sqlserver-web>', 'MultiAZ Deployment': True | False} 
-            """
+    logger.info('DB instances to be stopped: %s', dbidentifier_should_be_stopped)
 
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | RDS named {checkrds["DBInstances"][0]["DBInstanceIdentifier"]}:')
-            print(check_rds_details, "\n")
+    response_stopped_rds = []
 
-        response_stopped_rds = []
+    # check the list, if length = 0, no requests should be sent
+    if len(dbidentifier_should_be_stopped) == 0:
+        logger.info('No db instances should be stopped')
 
-        # check the list, if length = 0, no requests should be sent
-        if len(dbidentifier_should_be_stopped) == 0:
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | No db instances should be stopped')
+    # check the list, if length > 0, send request to stop designated RDS
+    elif len(dbidentifier_should_be_stopped) > 0:
 
-        # check the list, if length > 0, send request to stop designated RDS
-        elif len(dbidentifier_should_be_stopped) > 0:
+        # stop_db_instance only takes one db instance per request, so send the requests concurrently
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(dbidentifier_should_be_stopped))) as executor:
 
-            for rds_dbidentifier in dbidentifier_should_be_stopped:
-                stoprds = rds.stop_db_instance(
-                    DBInstanceIdentifier=rds_dbidentifier
-                    )
+            futures = {
+                executor.submit(rds.stop_db_instance, DBInstanceIdentifier=rds_dbidentifier): rds_dbidentifier
+                for rds_dbidentifier in dbidentifier_should_be_stopped
+            }
 
-                print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | Stopping {rds_dbidentifier}:\n{stoprds}')
+            for future in as_completed(futures):
+                stoprds = future.result()
+
+                logger.info('Stopping %s', futures[future])
+                logger.debug('%s', stoprds)
 
                 response_stopped_rds.append(stoprds['DBInstance']['DBInstanceIdentifier'])
 
-        return response_stopped_rds
+    return response_stopped_rds
 
-    def auto_start_eks_nodegroup(nodegroups):
+def log_eks_error(action, nodegroup, err):
+    # throttled requests have already been retried by the adaptive retry mode, log them separately from other errors
+    if err.response['Error']['Code'] in THROTTLING_ERROR_CODES:
+        logger.error("Throttled on %s node group %s after retries. Here's why: %s: %s", action, nodegroup["nodegroupname"],
+                     err.response['Error']['Code'], err.response['Error']['Message'])
+    else:
+        logger.error("Error on %s node group %s. Here's why: %s: %s", action, nodegroup["nodegroupname"],
+                     err.response['Error']['Code'], err.response['Error']['Message'])
 
-        eks = session.client('eks', region_name=region)
+def eks_jitter(jitter):
+    # spread out the burst of EKS requests when many node groups are handled at once
+    if jitter:
+        time.sleep(random.uniform(0, EKS_MAX_JITTER))
 
-        print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | session created in {region} for eks actions')
+def describe_nodegroup(eks, jitter, nodegroup):
 
-        started_node_groups = []
+    eks_jitter(jitter)
 
-        for nodegroup in nodegroups:
+    # always describe the node group, since its tags and scaling config may be changed outside this lambda container
+    try:
 
-            try:
+        nodegroup_config = eks.describe_nodegroup(
+            clusterName=nodegroup["cluster"],
+            nodegroupName=nodegroup["nodegroupname"]
+        )
 
-                nodegroup_config = eks.describe_nodegroup(
-                    clusterName=nodegroup["cluster"],
-                    nodegroupName=nodegroup["nodegroupname"]
-                )
+    except botocore.exceptions.ClientError as err:
+        log_eks_error('describing', nodegroup, err)
+        raise
 
-            except botocore.exceptions.ClientError as err:
-                logging.error("Error on describing node group %s. Here's why: %s: %s", nodegroup["nodegroupname"],
-                              err.response['Error']['Code'], err.response['Error']['Message'])
-                raise
+    logger.debug('%s', nodegroup_config)
+    '''
+    expected output:
+    {'nodegroup': {'nodegroupName': 'string', 'nodegroupArn': 'arn:aws:eks:<region>:<AWS ID>:nodegroup/<Cluster Name>/<Nodegroup Name>/<Nodegroup ID>', 'clusterName': 'string', 'scalingConfig': {'minSize': 1, 'maxSize': 5, 'desiredSize': 2}, 'tags': {'AutoStartStop': 'OfficeHour'}, ...}}
+    '''
 
-            # print(nodegroup_config)
-            '''
-            expected output:
-            {'nodegroup': {'nodegroupName': 'string', 'nodegroupArn': 'arn:aws:eks:<region>:<AWS ID>:nodegroup/<Cluster Name>/<Nodegroup Name>/<Nodegroup ID>', 'clusterName': 'string', 'scalingConfig': {'minSize': 1, 'maxSize': 5, 'desiredSize': 2}, 'tags': {'AutoStartStop': 'OfficeHour'}, ...}}
-            '''
+    return nodegroup_config
 
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | Is {nodegroup_config["nodegroup"]["nodegroupName"]} got tagged with scaling config?", nodegroup_config["nodegroup"]["tags"].get("nodegroup_scaling")')
+def start_one_nodegroup(eks, jitter, nodegroup):
 
-            if nodegroup_config['nodegroup']['tags'].get('nodegroup_scaling') == None:
+    nodegroup_config = describe_nodegroup(eks, jitter, nodegroup)
 
-                print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | Error: {nodegroup_config["nodegroup"]["nodegroupName"]} has no scaling config tag')
+    logger.info('Is %s got tagged with scaling config? %s', nodegroup_config['nodegroup']['nodegroupName'], nodegroup_config['nodegroup']['tags'].get('nodegroup_scaling'))
 
-            elif nodegroup_config['nodegroup']['tags'].get('nodegroup_scaling'):
+    if nodegroup_config['nodegroup']['tags'].get('nodegroup_scaling') == None:
 
-                decrypted_payload = json.loads(bytes.decode(base64.b64decode(bytes(nodegroup_config['nodegroup']['tags']['nodegroup_scaling'], 'utf-8'))))
-                print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | the json payload is {decrypted_payload}, and encoded with base64 = {nodegroup_config["nodegroup"]["tags"]["nodegroup_scaling"]}')
+        logger.error('%s has no scaling config tag', nodegroup_config['nodegroup']['nodegroupName'])
 
-                try:
+    elif nodegroup_config['nodegroup']['tags'].get('nodegroup_scaling'):
 
-                    start_nodegroup = eks.update_nodegroup_config(
-                        clusterName=nodegroup["cluster"],
-                        nodegroupName=nodegroup["nodegroupname"],
-                        scalingConfig=decrypted_payload
-                    )
+        decrypted_payload = json.loads(base64.b64decode(nodegroup_config['nodegroup']['tags']['nodegroup_scaling']))
+        logger.info('the json payload is %s, and encoded with base64 = %s', decrypted_payload, nodegroup_config['nodegroup']['tags']['nodegroup_scaling'])
 
-                except botocore.exceptions.ClientError as err:
-                    logging.error("Error on updating node group %s. Here's why: %s: %s", nodegroup["nodegroupname"],
-                                  err.response['Error']['Code'], err.response['Error']['Message'])
-                    raise
+        eks_jitter(jitter)
 
-                # print(start_nodegroup)
-                print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | {nodegroup["nodegroupname"]} has been started')
+        try:
 
-                started_node_groups.append(nodegroup)
+            start_nodegroup = eks.update_nodegroup_config(
+                clusterName=nodegroup["cluster"],
+                nodegroupName=nodegroup["nodegroupname"],
+                scalingConfig=decrypted_payload
+            )
 
-        return started_node_groups
+        except botocore.exceptions.ClientError as err:
+            log_eks_error('updating', nodegroup, err)
+            raise
 
-    def auto_stop_eks_nodegroup(nodegroups):
+        logger.debug('%s', start_nodegroup)
+        logger.info('%s has been started', nodegroup['nodegroupname'])
 
-        eks = session.client('eks', region_name=region)
+        return nodegroup
 
-        print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | session created in {region} for eks actions')
+def auto_start_eks_nodegroup(nodegroups):
 
-        stopped_node_groups = []
+    eks = get_client('eks', region)
 
-        for nodegroup in nodegroups:
+    logger.info('session created in %s for eks actions', region)
 
-            try:
+    started_node_groups = []
 
-                nodegroup_config = eks.describe_nodegroup(
-                    clusterName=nodegroup["cluster"],
-                    nodegroupName=nodegroup["nodegroupname"]
-                )
+    if len(nodegroups) == 0:
+        return started_node_groups
 
-            except botocore.exceptions.ClientError as err:
-                logging.error("Error on describing node group %s. Here's why: %s: %s", nodegroup["nodegroupname"],
-                              err.response['Error']['Code'], err.response['Error']['Message'])
-                raise
+    jitter = len(nodegroups) > EKS_JITTER_THRESHOLD
 
-            # print(nodegroup_config)
-            '''
-            expected output:
-            {'nodegroup': {'nodegroupName': 'string', 'nodegroupArn': 'arn:aws:eks:<region>:<AWS ID>:nodegroup/<Cluster Name>/<Nodegroup Name>/<Nodegroup ID>', 'clusterName': 'string', 'scalingConfig': {'minSize': 1, 'maxSize': 5, 'desiredSize': 2}, 'tags': {'AutoStartStop': 'OfficeHour'}, ...}}
-            '''
+    # each node group needs its own describe + update requests, so handle the node groups concurrently
+    with ThreadPoolExecutor(max_workers=min(EKS_MAX_WORKERS, len(nodegroups))) as executor:
 
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | Is {nodegroup_config["nodegroup"]["nodegroupName"]} got tagged with scaling config?", nodegroup_config["nodegroup"]["tags"].get("nodegroup_scaling")')
+        for started_nodegroup in executor.map(functools.partial(start_one_nodegroup, eks, jitter), nodegroups):
 
-            json_payload = json.dumps(nodegroup_config['nodegroup']['scalingConfig'])
-            encrypted_payload = base64.b64encode(bytes(json_payload, 'utf-8'))
-            encrypted_payload_str = str(encrypted_payload).split("\'")[1]
-            # print("encoded: ", encrypted_payload_str)
-            decrypted_payload_verified = bytes.decode(base64.b64decode(encrypted_payload), 'utf-8')
-            # print("decoded: ", decrypted_payload)
+            # node groups without scaling config tag are not started
+            if started_nodegroup:
+                started_node_groups.append(started_nodegroup)
 
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | the json payload is {decrypted_payload_verified}, and encoded with base64 = {encrypted_payload_str}')
+    return started_node_groups
 
-            if nodegroup_config['nodegroup']['tags'].get('nodegroup_scaling') == None:
+def stop_one_nodegroup(eks, jitter, nodegroup):
 
-                try:
-                    tag_config_to_nodgroup = eks.tag_resource(
-                        resourceArn=nodegroup_config['nodegroup']['nodegroupArn'],
-                        tags={
-                        'nodegroup_scaling': f'{encrypted_payload_str}'
-                        }
-                    )
-                    print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | tag on {nodegroup_config["nodegroup"]["nodegroupName"]} had been added')
+    nodegroup_config = describe_nodegroup(eks, jitter, nodegroup)
 
-                except botocore.exceptions.ClientError as err:
-                    logging.error("Error on tagging node group %s. Here's why: %s: %s", nodegroup["nodegroupname"],
-                                  err.response['Error']['Code'], err.response['Error']['Message'])
-                    raise
+    logger.info('Is %s got tagged with scaling config? %s', nodegroup_config['nodegroup']['nodegroupName'], nodegroup_config['nodegroup']['tags'].get('nodegroup_scaling'))
 
-            elif nodegroup_config['nodegroup']['tags'].get('nodegroup_scaling'):
+    json_payload = json.dumps(nodegroup_config['nodegroup']['scalingConfig'])
+    encrypted_payload_str = base64.b64encode(json_payload.encode('utf-8')).decode('ascii')
 
-                try:
-                    update_tag_config_to_nodgroup = eks.tag_resource(
-                        resourceArn=nodegroup_config['nodegroup']['nodegroupArn'],
-                        tags={
-                        'nodegroup_scaling': f'{encrypted_payload_str}'
-                        }
-                    )
-                    print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | tag on {nodegroup_config["nodegroup"]["nodegroupName"]} had been updated')
+    logger.info('the json payload is %s, and encoded with base64 = %s', json_payload, encrypted_payload_str)
 
-                except botocore.exceptions.ClientError as err:
-                    logging.error("Error on tagging node group %s. Here's why: %s: %s", nodegroup["nodegroupname"],
-                                  err.response['Error']['Code'], err.response['Error']['Message'])
-                    raise
+    if nodegroup_config['nodegroup']['tags'].get('nodegroup_scaling') == None:
 
-            try:
-                stop_nodegroup = eks.update_nodegroup_config(
-                    clusterName=nodegroup["cluster"],
-                    nodegroupName=nodegroup["nodegroupname"],
-                    scalingConfig={
-                        'minSize': 0,
-                        'maxSize': 1,
-                        'desiredSize': 0
-                    },
-                )
+        eks_jitter(jitter)
 
-            except botocore.exceptions.ClientError as err:
-                logging.error("Error on updating node group %s. Here's why: %s: %s", nodegroup["nodegroupname"],
-                              err.response['Error']['Code'], err.response['Error']['Message'])
-                raise
+        try:
+            tag_config_to_nodgroup = eks.tag_resource(
+                resourceArn=nodegroup_config['nodegroup']['nodegroupArn'],
+                tags={
+                'nodegroup_scaling': f'{encrypted_payload_str}'
+                }
+            )
+            logger.info('tag on %s had been added', nodegroup_config['nodegroup']['nodegroupName'])
 
-            # print(stop_nodegroup)
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | {nodegroup["nodegroupname"]} has been stopped')
+        except botocore.exceptions.ClientError as err:
+            log_eks_error('tagging', nodegroup, err)
+            raise
 
-            stopped_node_groups.append(nodegroup)
+    elif nodegroup_config['nodegroup']['tags'].get('nodegroup_scaling'):
 
-        return stopped_node_groups
+        eks_jitter(jitter)
 
-    def check_payload_tag(payload):
-        #payload = events
-        tagKey = ['DCP/AutoStartStop']
-        tagValues = ['OfficeHour', 'ExtendedOfficeHour1', 'ExtendedOfficeHour2', 'UpperHalf', 'LowerHalf', 'RecurringStop']
         try:
-            tagKey_exist = tagKey.index(payload['details']['tag key'])
-        except ValueError:
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | Payload ValueError, "tag key": \"{payload["details"]["tag key"]}\" is not a valid value')
-            return {"details": payload["details"], "error": "Invalid Tag Key"}
+            update_tag_config_to_nodgroup = eks.tag_resource(
+                resourceArn=nodegroup_config['nodegroup']['nodegroupArn'],
+                tags={
+                'nodegroup_scaling': f'{encrypted_payload_str}'
+                }
+            )
+            logger.info('tag on %s had been updated', nodegroup_config['nodegroup']['nodegroupName'])
 
-        try:
-            tagValue_exis = tagValues.index(payload['details']['tag value'])
-        except ValueError:
-            print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | Payload ValueError, "tag value": \"{payload["details"]["tag value"]}\" is not a valid value')
-            return {"details": payload["details"], "error": "Invalid Tag Value"}
-        else:
-            return {"details": payload["details"], "error": ""}
+        except botocore.exceptions.ClientError as err:
+            log_eks_error('tagging', nodegroup, err)
+            raise
+
+    eks_jitter(jitter)
+
+    try:
+        stop_nodegroup = eks.update_nodegroup_config(
+            clusterName=nodegroup["cluster"],
+            nodegroupName=nodegroup["nodegroupname"],
+            scalingConfig={
+                'minSize': 0,
+                'maxSize': 1,
+                'desiredSize': 0
+            },
+        )
+
+    except botocore.exceptions.ClientError as err:
+        log_eks_error('updating', nodegroup, err)
+        raise
+
+    logger.debug('%s', stop_nodegroup)
+    logger.info('%s has been stopped', nodegroup['nodegroupname'])
+
+    return nodegroup
+
+def auto_stop_eks_nodegroup(nodegroups):
+
+    eks = get_client('eks', region)
+
+    logger.info('session created in %s for eks actions', region)
+
+    if len(nodegroups) == 0:
+        return []
 
+    jitter = len(nodegroups) > EKS_JITTER_THRESHOLD
 
-    def response(action, list):
-        final_result = {
-            'Status': 'Successful',
-            'AWS_ID': context.invoked_function_arn.split(":")[4],
-            'Time': datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M"),
-            'Action': action,
-            'ResourceList': list
-        }
-        return json.dumps(final_result)
+    # each node group needs its own describe + tag + update requests, so handle the node groups concurrently
+    with ThreadPoolExecutor(max_workers=min(EKS_MAX_WORKERS, len(nodegroups))) as executor:
+        stopped_node_groups = list(executor.map(functools.partial(stop_one_nodegroup, eks, jitter), nodegroups))
 
+    return stopped_node_groups
+
+def check_payload_tag(payload):
+    #payload = events
+    if payload['details']['tag key'] not in VALID_TAG_KEYS:
+        logger.warning('Payload ValueError, "tag key": "%s" is not a valid value', payload['details']['tag key'])
+        return {"details": payload["details"], "error": "Invalid Tag Key"}
+
+    if payload['details']['tag value'] not in VALID_TAG_VALUES:
+        logger.warning('Payload ValueError, "tag value": "%s" is not a valid value', payload['details']['tag value'])
+        return {"details": payload["details"], "error": "Invalid Tag Value"}
+
+    return {"details": payload["details"], "error": ""}
+
+
+# the lambda runtime serialises the returned dict to json
+def response(action, resources, base):
+    return {
+        'Status': 'Successful',
+        **base,
+        'Action': action,
+        'ResourceList': resources
+    }
+
+def failed_response(base):
+    return {
+        'Status': 'Failed',
+        **base
+    }
+
+# (automation, resource) -> (automation function, tagged resource lookup, action reported in the response)
+DISPATCH = {
+    ('stop', 'ec2'): (auto_stop_instance, get_tagged_instance, 'Stop EC2 instance'),
+    ('start', 'ec2'): (auto_start_instance, get_tagged_instance, 'Start EC2 instance'),
+    ('stop', 'rds'): (auto_stop_dbinstance, get_tagged_dbinstance, 'Stop RDS'),
+    ('start', 'rds'): (auto_start_dbinstance, get_tagged_dbinstance, 'Start RDS'),
+    ('stop', 'eks'): (auto_stop_eks_nodegroup, get_tagged_ekscluster, 'Stop EKS node group'),
+    ('start', 'eks'): (auto_start_eks_nodegroup, get_tagged_ekscluster, 'Start EKS node group'),
+}
+
+
+def lambda_handler(event, context):
+    """
+    :param event: { "details": { "automation": "start", "resource": "rds", "tag key": "AutoStartStop", "tag value": "ExtendedOfficeHour2" } }
+    """
+    # the response time has minute resolution, so format the timestamp once per invocation
+    timestamp = time.strftime("%d %b %Y - %H:%M")
+
+    # arn:aws:lambda:<region>:<AWS ID>:function:<function name>, only split up to the AWS ID
+    aws_id = context.invoked_function_arn.split(":", 5)[4]
+
+    # fields shared by every response of this invocation
+    base = {
+        'AWS_ID': aws_id,
+        'Time': timestamp
+    }
+
+    logger.info('Event: %s', event)
 
     # ******      main function started      ******
 
     event = check_payload_tag(event)
 
     if event['error'] == 'Invalid Tag Key' or event['error'] == 'Invalid Tag Value':
-        print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | Event: {event} is not valid')
-        return json.dumps({
-            'Status': 'Failed',
-            'AWS_ID': context.invoked_function_arn.split(":")[4],
-            'Time': datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")
-        })
-
-    # stop ec2
-    if event['details']['automation'].lower() == 'stop' and event['details']['resource'] == 'ec2':
-        stopped_ec2 = auto_stop_instance(get_tagged_instance())
-        return response('Stop EC2 instance', stopped_ec2)
-
-    # start ec2
-    elif event['details']['automation'].lower() == 'start' and event['details']['resource'] == 'ec2':
-        started_ec2 = auto_start_instance(get_tagged_instance())
-        return response('Start EC2 instance', started_ec2)
-
-    # stop RDS
-    elif event['details']['automation'].lower() == 'stop' and event['details']['resource'] == 'rds':
-        stopped_rds = auto_stop_dbinstance(get_tagged_dbinstance())
-        return response('Stop RDS', stopped_rds)
-
-    # start RDS
-    elif event['details']['automation'].lower() == 'start' and event['details']['resource'] == 'rds':
-        started_rds = auto_start_dbinstance(get_tagged_dbinstance())
-        return response('Start RDS', started_rds)
-
-    # stop EKS node group
-    elif event['details']['automation'].lower() == 'stop' and event['details']['resource'] == 'eks':
-        stopped_nodegroups = auto_stop_eks_nodegroup(get_tagged_ekscluster())
-        return response('Stop EKS node group', stopped_nodegroups)
-
-    # start EKS node group
-    elif event['details']['automation'].lower() == 'start' and event['details']['resource'] == 'eks':
-        started_nodegroups = auto_start_eks_nodegroup(get_tagged_ekscluster())
-        return response('Start EKS node group', started_nodegroups)
+        logger.warning('Event: %s is not valid', event)
+        return failed_response(base)
 
-    else:
-        print(f'[{datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M")}] | Event: {event} is not valid')
-        return json.dumps({
-            'Status': 'Failed',
-            'AWS_ID': context.invoked_function_arn.split(":")[4],
-            'Time': datetime.datetime.now(tz=None).strftime("%d %b %Y - %H:%M"),
-        })
-
-    # next_Token = ''
-    # while next_Token != None:
-    #     resources = []
-    #     resources.clear()
-    #     get_inventory = get_resource_list_from_config(resource_type,next_Token)
-    #     print(get_inventory)
-    #     next_Token = get_inventory[1]
-    #
-    #     if not get_inventory[0]:
-    #         print(f'no resource in this type')
-    #         continue
-    #
-    #     print(f'list is not empty')
-    #
-    #     if next_Token == '':
-    #         print('next token is empty')
-    #     else:
-    #         print(f'next token is {next_Token}')
-    #
-    #     for resource in get_inventory[0]:
-    #         resources.append(resource)
-    #
-    #     resource_list = search_for_resource_details(resources)
-    #
-    #     for object in resource_list:
-    #         final_resource_list.append(object)
-
-if __name__ == "__main__":
-    #lambda_handler({"details": {"automation": "stop", "resource": "eks", "tag key": "AutoStartStop", "tag value": "OfficeHour"}}, {})
-    lambda_handler({},{})
\ No newline at end of file
+    tag_key = event['details']['tag key']
+    tag_value = event['details']['tag value']
+
+    # normalise the automation and resource once, the DISPATCH keys are lower case
+    automation = event['details']['automation'].casefold()
+    resource = event['details']['resource'].casefold()
+
+    dispatch = DISPATCH.get((automation, resource))
+
+    if dispatch is None:
+        logger.warning('Event: %s is not valid', event)
+        return failed_response(base)
+
+    automate, get_tagged, action = dispatch
+    return response(action, automate(get_tagged(tag_key, tag_value)), base)
+
+
+# local run only, e.g. LOCAL_TEST=1 AWS_REGION=ap-southeast-1 python main.py
+if __name__ == "__main__" and os.environ.get('LOCAL_TEST') == '1':
+    lambda_handler(
+        {"details": {"automation": "stop", "resource": "ec2", "tag key": "DCP/AutoStartStop", "tag value": "OfficeHour"}},
+        types.SimpleNamespace(invoked_function_arn='arn:aws:lambda:us-east-1:000000000000:function:test')
+    )